@@ -1,51 +1,70 @@
 import argparse
+import asyncio
+import sys
 from pathlib import Path
 from typing import Literal, Optional
 
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel, Field
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 
 try:
-    from .core import graph
+    from .core import get_client, http_client, run_graph_fast, stream_answer
 except ImportError:
-    from core import graph
+    from core import get_client, http_client, run_graph_fast, stream_answer
 
 
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
     question: str = Field(..., min_length=1)
 
 
 class ChatResponse(BaseModel):
-    method: Literal["explicit"]
+    model_config = ConfigDict(extra="forbid")
+
+    method: Literal["explicit"] = "explicit"
     intent: Literal["weather", "joke"]
     answer: str
     city: Optional[str] = None
     topic: Optional[str] = None
 
 
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """GZip responses except the SSE stream.
+
+    GZipMiddleware compresses streaming responses regardless of
+    minimum_size, and zlib's buffering would hold back the small token
+    frames /chat/stream exists to deliver progressively.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"] == "/chat/stream":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 app = FastAPI(title="LangGraph Explicit Nodes API", version="1.0.0")
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=500)
 BASE_DIR = Path(__file__).resolve().parent
 UI_FILE = BASE_DIR / "templates" / "index.html"
+# The page is static, so read and decode it once at import instead of on
+# every GET /.
+UI_HTML = UI_FILE.read_text(encoding="utf-8") if UI_FILE.exists() else None
 
 
-def run_graph(question: str) -> ChatResponse:
+async def run_graph(question: str) -> ChatResponse:
     cleaned = question.strip()
     if not cleaned:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
-    result = graph.invoke(
-        {
-            "user_input": cleaned,
-            "intent": "joke",
-            "city": None,
-            "topic": None,
-            "final_answer": None,
-        }
-    )
+    result = await run_graph_fast(cleaned)
 
-    return ChatResponse(
+    # The graph already constrains these values, so skip re-validation.
+    return ChatResponse.model_construct(
         method="explicit",
         intent=result["intent"],
         answer=result.get("final_answer") or "No answer generated.",
@@ -54,6 +73,28 @@ def run_graph(question: str) -> ChatResponse:
     )
 
 
+@app.on_event("startup")
+async def warm_connections() -> None:
+    # Pay the TCP+TLS handshakes to both upstreams at startup so the first
+    # user request starts from a warm connection pool. Best effort only; the
+    # response bodies do not matter. Warm each upstream separately so a
+    # failure in one (e.g. missing API key) never leaves the other's
+    # coroutine constructed but unawaited.
+    try:
+        await http_client.get("https://api.openweathermap.org/")
+    except Exception:
+        pass
+    try:
+        await get_client().models.list()
+    except Exception:
+        pass
+
+
+@app.on_event("shutdown")
+async def close_http_client() -> None:
+    await http_client.aclose()
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok"}
@@ -61,17 +102,63 @@ def health() -> dict[str, str]:
 
 @app.get("/", response_class=HTMLResponse)
 def ui() -> str:
-    if not UI_FILE.exists():
+    if UI_HTML is None:
         raise HTTPException(status_code=500, detail=f"UI file not found: {UI_FILE}")
-    return UI_FILE.read_text(encoding="utf-8")
+    return UI_HTML
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(payload: ChatRequest) -> ChatResponse:
-    return run_graph(payload.question)
+async def chat(payload: ChatRequest) -> ChatResponse:
+    return await run_graph(payload.question)
+
 
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatRequest) -> StreamingResponse:
+    cleaned = payload.question.strip()
+    if not cleaned:
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    async def gen():
+        async for piece in stream_answer(cleaned):
+            # Every line of a chunk needs its own "data:" prefix or clients
+            # misparse events containing embedded newlines.
+            yield "".join(f"data: {line}\n" for line in piece.split("\n")) + "\n"
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
+
+
+async def _answer_question(user_input: str) -> list[str]:
+    try:
+        result = await run_graph(user_input)
+    except HTTPException as error:
+        return [f"Error: {error.detail}"]
+    except Exception as error:
+        return [f"Error: {error}"]
+
+    lines = [f"Intent: {result.intent}"]
+    if result.city:
+        lines.append(f"City: {result.city}")
+    if result.topic:
+        lines.append(f"Topic: {result.topic}")
+    lines.append(f"Assistant: {result.answer}")
+    return lines
+
+
+# One event loop for the whole session: the pooled HTTP clients are
+# process-global, so running each question under its own asyncio.run would
+# reuse connections opened in an already-closed loop.
+async def run_cli() -> None:
+    if not sys.stdin.isatty():
+        # Piped input: iterate stdin and write one batched block per
+        # question instead of flushing line by line.
+        for line in sys.stdin:
+            user_input = line.strip()
+            if not user_input:
+                continue
+            sys.stdout.write("\n".join(await _answer_question(user_input)) + "\n")
+            sys.stdout.flush()
+        return
 
-def run_cli() -> None:
     print("LangGraph Explicit Chat (type 'exit' to quit)")
     while True:
         try:
@@ -86,18 +173,8 @@ def run_cli() -> None:
         if not user_input:
             continue
 
-        try:
-            result = run_graph(user_input)
-            print(f"Intent: {result.intent}")
-            if result.city:
-                print(f"City: {result.city}")
-            if result.topic:
-                print(f"Topic: {result.topic}")
-            print(f"Assistant: {result.answer}")
-        except HTTPException as error:
-            print(f"Error: {error.detail}")
-        except Exception as error:
-            print(f"Error: {error}")
+        sys.stdout.write("\n".join(await _answer_question(user_input)) + "\n")
+        sys.stdout.flush()
 
 
 def main() -> None:
@@ -118,9 +195,15 @@ def main() -> None:
     args = parser.parse_args()
 
     if args.mode == "cli":
-        run_cli()
+        asyncio.run(run_cli())
     else:
-        uvicorn.run("app:app", host=args.host, port=args.port, reload=args.reload)
+        uvicorn.run(
+            "app:app",
+            host=args.host,
+            port=args.port,
+            reload=args.reload,
+            loop="uvloop",
+        )
 
 
 if __name__ == "__main__":
@@ -1,10 +1,18 @@
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import re
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal, Optional, TypedDict
+from typing import AsyncIterator, Literal, Optional, TypedDict
 
-import requests
+import httpx
+import numpy as np
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from langgraph.graph import END, StateGraph
 
@@ -13,26 +21,57 @@ BASE_DIR = Path(__file__).resolve().parent
 
 
 def load_environment() -> None:
-    env_file = os.getenv("ENV_FILE")
-    if env_file:
-        load_dotenv(env_file, override=False)
-        return
-    load_dotenv(BASE_DIR / ".env", override=False)
-    load_dotenv(override=False)
-
+    target = Path(os.getenv("ENV_FILE") or (BASE_DIR / ".env"))
+    if target.exists():
+        load_dotenv(target, override=False)
+
+
+@dataclass(frozen=True)
+class Config:
+    openai_api_key: str
+    openweather_api_key: str
+    openai_model: str
+    router_model: str
+
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Load and validate configuration once per process.
+
+    Importing this module repeatedly (tests, uvicorn --reload workers) no
+    longer reparses .env at import time; the first caller pays the cost.
+    """
+    load_environment()
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    openweather_api_key = os.getenv("OPENWEATHER_API_KEY")
+
+    if not openai_api_key:
+        raise ValueError("OPENAI_API_KEY not found. Set it in ENV_FILE or environment.")
+    if not openweather_api_key:
+        raise ValueError("OPENWEATHER_API_KEY not found. Set it in ENV_FILE or environment.")
+
+    openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    return Config(
+        openai_api_key=openai_api_key,
+        openweather_api_key=openweather_api_key,
+        openai_model=openai_model,
+        # The router is a trivial classification; a smaller model works just
+        # as well at temperature=0 and costs a fraction.
+        router_model=os.getenv("ROUTER_MODEL", openai_model),
+    )
 
-load_environment()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+@functools.lru_cache(maxsize=1)
+def get_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=get_config().openai_api_key)
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found. Set it in ENV_FILE or environment.")
-if not OPENWEATHER_API_KEY:
-    raise ValueError("OPENWEATHER_API_KEY not found. Set it in ENV_FILE or environment.")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+http_client = httpx.AsyncClient(
+    timeout=20,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
 
 
 class ExplicitState(TypedDict):
@@ -43,103 +82,362 @@ class ExplicitState(TypedDict):
     final_answer: Optional[str]
 
 
-def llm_text(system_prompt: str, user_prompt: str, temperature: float = 0.2) -> str:
-    result = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        temperature=temperature,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-    )
-    return (result.choices[0].message.content or "").strip()
+# Completions at low temperature are deterministic enough to replay; skip the
+# cache for creative calls (e.g. jokes at temperature=0.8).
+LLM_CACHE_MAX_TEMPERATURE = 0.5
+llm_cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+
+# Bound the number of in-flight OpenAI calls so a burst of requests
+# multiplexes over the pooled connections instead of fanning out unbounded.
+llm_semaphore = asyncio.Semaphore(64)
 
 
-def router_node(state: ExplicitState) -> ExplicitState:
-    classification = llm_text(
+def _llm_cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+    payload = json.dumps(
+        {"m": model, "s": system_prompt, "u": user_prompt, "t": temperature},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def llm_text(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float = 0.2,
+    response_format: Optional[dict] = None,
+    stream: bool = False,
+    model: Optional[str] = None,
+) -> str:
+    model = model or get_config().openai_model
+    cacheable = temperature <= LLM_CACHE_MAX_TEMPERATURE
+    key = _llm_cache_key(model, system_prompt, user_prompt, temperature)
+    if cacheable:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+    extra = {"response_format": response_format} if response_format else {}
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    async with llm_semaphore:
+        if stream:
+            pieces = []
+            async for chunk in await get_client().chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+                stream=True,
+                **extra,
+            ):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+            text = "".join(pieces).strip()
+        else:
+            result = await get_client().chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+                **extra,
+            )
+            text = (result.choices[0].message.content or "").strip()
+    if cacheable:
+        llm_cache[key] = text
+    return text
+
+
+async def llm_stream(
+    system_prompt: str, user_prompt: str, temperature: float = 0.2
+) -> AsyncIterator[str]:
+    """Yield completion text chunks as they arrive; bypasses the cache."""
+    async with llm_semaphore:
+        async for chunk in await get_client().chat.completions.create(
+            model=get_config().openai_model,
+            temperature=temperature,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            stream=True,
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+RouterLabel = tuple[str, Optional[str], Optional[str]]
+
+
+class SemanticRouterCache:
+    """Cache router classifications keyed by embedding similarity.
+
+    Semantically equivalent questions ("weather in Paris" vs "how's Paris
+    weather") hit the same cached (intent, city, topic) label, skipping the
+    chat-completion call. Embeddings are stored normalized so lookup is a
+    single matrix-vector product; the store persists to an .npz file so hits
+    survive restarts.
+
+    Entries append into a preallocated buffer that doubles as needed (no
+    per-store re-stacking) and overwrite the oldest slot once maxsize is
+    reached. Persistence runs in a worker thread every save_interval stores
+    so the event loop never blocks on writing the full store.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        threshold: float = 0.92,
+        maxsize: int = 10_000,
+        save_interval: int = 32,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.save_interval = save_interval
+        self._buffer: Optional[np.ndarray] = None
+        self._labels: list[RouterLabel] = []
+        self._next = 0
+        self._unsaved = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = np.load(self.path, allow_pickle=True)
+            self._buffer = np.asarray(data["embeddings"], dtype=np.float32)
+            self._labels = [tuple(label) for label in data["labels"].tolist()]
+        except Exception:
+            self._buffer = None
+            self._labels = []
+
+    def _schedule_save(self) -> None:
+        # Snapshot under the loop, write in a worker thread: np.savez of the
+        # full store is far too slow to run inline in a request.
+        embeddings = self._buffer[: len(self._labels)].copy()
+        labels = np.array(self._labels, dtype=object)
+        asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(np.savez, self.path, embeddings=embeddings, labels=labels),
+        )
+
+    async def _embed(self, question: str) -> np.ndarray:
+        async with llm_semaphore:
+            result = await get_client().embeddings.create(
+                model="text-embedding-3-small",
+                input=question,
+            )
+        vector = np.asarray(result.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    async def lookup(self, question: str) -> tuple[Optional[RouterLabel], np.ndarray]:
+        """Return (cached label or None, query embedding for a later store)."""
+        query = await self._embed(question)
+        if self._buffer is not None and len(self._labels):
+            scores = self._buffer[: len(self._labels)] @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._labels[best], query
+        return None, query
+
+    def store(self, query: np.ndarray, label: RouterLabel) -> None:
+        if len(self._labels) >= self.maxsize:
+            # Full: ring-overwrite the oldest entry.
+            self._buffer[self._next] = query
+            self._labels[self._next] = label
+            self._next = (self._next + 1) % self.maxsize
+        else:
+            if self._buffer is None:
+                self._buffer = np.empty((256, query.shape[0]), dtype=np.float32)
+            elif len(self._labels) == len(self._buffer):
+                grown = np.empty(
+                    (min(len(self._buffer) * 2, self.maxsize), query.shape[0]),
+                    dtype=np.float32,
+                )
+                grown[: len(self._labels)] = self._buffer[: len(self._labels)]
+                self._buffer = grown
+            self._buffer[len(self._labels)] = query
+            self._labels.append(label)
+
+        self._unsaved += 1
+        if self._unsaved >= self.save_interval:
+            self._unsaved = 0
+            self._schedule_save()
+
+
+router_cache = SemanticRouterCache(BASE_DIR / ".router_cache.npz")
+
+# Obvious weather questions skip both the embedding lookup and the LLM
+# classifier; the city is pulled from an "in <City>" phrase when present.
+WEATHER_RE = re.compile(
+    r"\b(weather|forecast|temperature|rain|snow|humidity|wind|climate)\b", re.I
+)
+CITY_RE = re.compile(r"\bin\s+([A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*)")
+
+ROUTER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "route",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "intent": {"enum": ["weather", "joke"]},
+                "city": {"type": ["string", "null"]},
+                "topic": {"type": ["string", "null"]},
+                "answer": {"type": ["string", "null"]},
+            },
+            "required": ["intent", "city", "topic", "answer"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+async def router_node(state: ExplicitState) -> dict:
+    if WEATHER_RE.search(state["user_input"]):
+        # Only short-circuit when a city is extractable; a bare keyword hit
+        # is ambiguous (lowercase city, or a joke about rain) and falls
+        # through to the classifier.
+        city_match = CITY_RE.search(state["user_input"])
+        if city_match:
+            return {
+                "intent": "weather",
+                "city": city_match.group(1),
+                "topic": None,
+            }
+
+    cached_label, query_embedding = await router_cache.lookup(state["user_input"])
+    if cached_label is not None:
+        cached_intent, cached_city, cached_topic = cached_label
+        return {
+            "intent": "weather" if cached_intent == "weather" else "joke",
+            "city": cached_city,
+            "topic": cached_topic,
+        }
+
+    classification = await llm_text(
         system_prompt=(
             "Classify the user message into weather or joke. "
-            "Return exactly these labeled lines and nothing else."
+            "For weather, fill intent, city, and topic and leave answer null. "
+            "For joke, also fill answer with one short, clean joke on the "
+            "topic. Respond with the JSON object only."
         ),
-        user_prompt=(
-            "Format:\n"
-            "INTENT: weather|joke\n"
-            "CITY: <city or empty>\n"
-            "TOPIC: <topic or general>\n\n"
-            f"Message: {state['user_input']}"
-        ),
-        temperature=0,
+        user_prompt=f"Message: {state['user_input']}",
+        # Non-zero so the fused joke varies between asks and the call stays
+        # above the exact-match cache's temperature cutoff; the intent and
+        # city fields are pinned down by the strict schema regardless.
+        temperature=0.7,
+        response_format=ROUTER_RESPONSE_FORMAT,
+        model=get_config().router_model,
     )
 
-    intent: Literal["weather", "joke"] = "joke"
-    city: Optional[str] = None
-    topic: Optional[str] = "general"
+    try:
+        data = json.loads(classification)
+    except json.JSONDecodeError:
+        # Degrade to the joke default rather than turning /chat into a 500,
+        # but don't store a label the model never produced — the semantic
+        # cache would keep misrouting similar questions across restarts.
+        return {"intent": "joke", "city": None, "topic": "general"}
 
-    for line in classification.splitlines():
-        text = line.strip()
-        if text.startswith("INTENT:"):
-            parsed = text.split(":", 1)[1].strip().lower()
-            intent = "weather" if parsed == "weather" else "joke"
-        elif text.startswith("CITY:"):
-            parsed = text.split(":", 1)[1].strip()
-            city = parsed or None
-        elif text.startswith("TOPIC:"):
-            parsed = text.split(":", 1)[1].strip()
-            topic = parsed or "general"
+    intent: Literal["weather", "joke"] = (
+        "weather" if data.get("intent") == "weather" else "joke"
+    )
+    city: Optional[str] = (data.get("city") or "").strip() or None
+    topic: Optional[str] = (data.get("topic") or "").strip() or "general"
 
-    return {**state, "intent": intent, "city": city, "topic": topic}
+    router_cache.store(query_embedding, (intent, city, topic))
 
+    # The fused call already produced the joke, so skip the joke node.
+    answer = (data.get("answer") or "").strip()
+    if intent == "joke" and answer:
+        return {"intent": intent, "city": city, "topic": topic, "final_answer": answer}
+
+    return {"intent": intent, "city": city, "topic": topic}
+
+
+# Weather barely changes within a few minutes, so identical city lookups
+# reuse the parsed payload instead of hitting OpenWeather again.
+weather_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+# Prompts shared by the graph nodes and the streaming path.
+WEATHER_ANSWER_SYSTEM_PROMPT = (
+    "You are a concise assistant. Use the provided weather summary only."
+)
+JOKE_SYSTEM_PROMPT = "Tell one short, clean joke."
 
-def weather_node(state: ExplicitState) -> ExplicitState:
-    city = (state.get("city") or "").strip()
-    if not city:
-        return {
-            **state,
-            "final_answer": "Please include a city so I can check the weather.",
-        }
 
-    response = requests.get(
-        "https://api.openweathermap.org/data/2.5/weather",
-        params={"q": city, "appid": OPENWEATHER_API_KEY, "units": "metric"},
-        timeout=20,
+def _weather_answer_prompt(question: str, summary: str) -> str:
+    return (
+        f"User asked: {question}\n"
+        f"Weather summary: {summary}\n"
+        "Write a short friendly answer."
     )
-    payload = response.json()
 
-    if response.status_code != 200:
-        details = payload.get("message", "Unknown error") if isinstance(payload, dict) else str(payload)
-        return {
-            **state,
-            "final_answer": f"I could not fetch weather for '{city}'. API returned: {details}.",
-        }
+
+def _joke_prompt(topic: str) -> str:
+    return f"Topic: {topic}"
+
+
+async def _weather_summary(city: str) -> tuple[Optional[str], Optional[str]]:
+    """Fetch and format the weather for a city.
+
+    Returns (summary, error_answer); exactly one is set.
+    """
+    cache_key = city.lower()
+    payload = weather_cache.get(cache_key)
+    if payload is None:
+        response = await http_client.get(
+            "https://api.openweathermap.org/data/2.5/weather",
+            params={"q": city, "appid": get_config().openweather_api_key, "units": "metric"},
+        )
+        payload = response.json()
+
+        if response.status_code != 200:
+            details = payload.get("message", "Unknown error") if isinstance(payload, dict) else str(payload)
+            return None, f"I could not fetch weather for '{city}'. API returned: {details}."
+
+        weather_cache[cache_key] = payload
 
     summary = (
         f"{city}: {payload['weather'][0]['description']}, "
         f"{payload['main']['temp']} deg C, humidity {payload['main']['humidity']}%."
     )
+    return summary, None
 
-    answer = llm_text(
-        system_prompt="You are a concise assistant. Use the provided weather summary only.",
-        user_prompt=(
-            f"User asked: {state['user_input']}\n"
-            f"Weather summary: {summary}\n"
-            "Write a short friendly answer."
-        ),
+
+async def weather_node(state: ExplicitState) -> dict:
+    city = (state.get("city") or "").strip()
+    if not city:
+        return {"final_answer": "Please include a city so I can check the weather."}
+
+    summary, error_answer = await _weather_summary(city)
+    if error_answer is not None:
+        return {"final_answer": error_answer}
+
+    answer = await llm_text(
+        system_prompt=WEATHER_ANSWER_SYSTEM_PROMPT,
+        user_prompt=_weather_answer_prompt(state["user_input"], summary),
         temperature=0.3,
+        stream=True,
     )
-    return {**state, "final_answer": answer}
+    return {"final_answer": answer}
 
 
-def joke_node(state: ExplicitState) -> ExplicitState:
+async def joke_node(state: ExplicitState) -> dict:
     topic = (state.get("topic") or "general").strip()
-    answer = llm_text(
-        system_prompt="Tell one short, clean joke.",
-        user_prompt=f"Topic: {topic}",
+    answer = await llm_text(
+        system_prompt=JOKE_SYSTEM_PROMPT,
+        user_prompt=_joke_prompt(topic),
         temperature=0.8,
     )
-    return {**state, "final_answer": answer}
+    return {"final_answer": answer}
 
 
 def route_decision(state: ExplicitState) -> str:
+    if state.get("final_answer"):
+        return END
     return "weather_node" if state["intent"] == "weather" else "joke_node"
 
 
@@ -151,8 +449,77 @@ builder.set_entry_point("router_node")
 builder.add_conditional_edges(
     "router_node",
     route_decision,
-    {"weather_node": "weather_node", "joke_node": "joke_node"},
+    {"weather_node": "weather_node", "joke_node": "joke_node", END: END},
 )
 builder.add_edge("weather_node", END)
 builder.add_edge("joke_node", END)
 graph = builder.compile()
+
+
+async def run_graph_fast(question: str) -> ExplicitState:
+    """Execute router -> (weather | joke) as plain awaits.
+
+    Same node logic as the compiled graph without the generic graph
+    interpreter's per-node dispatch; `graph` stays around for dev/debug.
+    """
+    state: ExplicitState = {
+        "user_input": question,
+        "intent": "joke",
+        "city": None,
+        "topic": None,
+        "final_answer": None,
+    }
+    state = {**state, **(await router_node(state))}
+
+    if state.get("final_answer"):
+        return state
+
+    if state["intent"] == "weather":
+        return {**state, **(await weather_node(state))}
+    return {**state, **(await joke_node(state))}
+
+
+async def stream_answer(question: str) -> AsyncIterator[str]:
+    """Yield the answer for a question chunk by chunk.
+
+    Routes exactly like the graph, but streams the final completion so the
+    client sees tokens as they are generated instead of waiting for the
+    full answer.
+    """
+    state: ExplicitState = {
+        "user_input": question,
+        "intent": "joke",
+        "city": None,
+        "topic": None,
+        "final_answer": None,
+    }
+    state = {**state, **(await router_node(state))}
+
+    if state.get("final_answer"):
+        yield state["final_answer"]
+        return
+
+    if state["intent"] == "weather":
+        city = (state.get("city") or "").strip()
+        if not city:
+            yield "Please include a city so I can check the weather."
+            return
+        summary, error_answer = await _weather_summary(city)
+        if error_answer is not None:
+            yield error_answer
+            return
+        async for piece in llm_stream(
+            system_prompt=WEATHER_ANSWER_SYSTEM_PROMPT,
+            user_prompt=_weather_answer_prompt(question, summary),
+            temperature=0.3,
+        ):
+            yield piece
+        return
+
+    topic = (state.get("topic") or "general").strip()
+    async for piece in llm_stream(
+        system_prompt=JOKE_SYSTEM_PROMPT,
+        user_prompt=_joke_prompt(topic),
+        temperature=0.8,
+    ):
+        yield piece